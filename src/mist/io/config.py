@@ -36,6 +36,12 @@ PY_LOG_FORMAT = settings.get("PY_LOG_FORMAT", '%(asctime)s %(levelname)s %(threa
 PY_LOG_FORMAT_DATE = settings.get("PY_LOG_FORMAT_DATE", "%Y-%m-%d %H:%M:%S")
 GOOGLE_ANALYTICS_ID = settings.get("GOOGLE_ANALYTICS_ID", "")
 COMMAND_TIMEOUT = settings.get("COMMAND_TIMEOUT", 20)
+# seconds an unused pooled ssh connection is kept open, see mist.io.ssh_pool
+SSH_POOL_IDLE_TIMEOUT = settings.get("SSH_POOL_IDLE_TIMEOUT", 300)
+SSH_POOL_MAX_SIZE = settings.get("SSH_POOL_MAX_SIZE", 256)
+# OpenSSH ControlMaster sockets used by ansible runs, see run_playbook
+SSH_CONTROL_DIR = settings.get("SSH_CONTROL_DIR", "/tmp/mist-ssh")
+SSH_CONTROL_PERSIST = settings.get("SSH_CONTROL_PERSIST", 600)
 ALLOW_CONNECT_LOCALHOST = settings.get('ALLOW_CONNECT_LOCALHOST', True)
 ALLOW_CONNECT_PRIVATE = settings.get('ALLOW_CONNECT_PRIVATE', True)
 # allow mist.io to connect to KVM hypervisor running on the same server
@@ -73,7 +79,7 @@ STATES = {
 
 
 # All EC2 providers, useful for type checking
-EC2_PROVIDERS = (
+EC2_PROVIDERS = frozenset((
     Provider.EC2_US_EAST,
     Provider.EC2_AP_NORTHEAST,
     Provider.EC2_AP_NORTHEAST1,
@@ -85,7 +91,7 @@ EC2_PROVIDERS = (
     Provider.EC2_AP_SOUTHEAST2,
     Provider.EC2_SA_EAST,
     Provider.EC2_US_WEST_OREGON
-)
+))
 
 
 EC2_SECURITYGROUP = {
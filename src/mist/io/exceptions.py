@@ -29,6 +29,8 @@ exception handler.
 """
 
 
+import sys
+import linecache
 import traceback
 
 
@@ -46,10 +48,47 @@ class MistError(Exception):
         if exc is None and isinstance(msg, Exception):
             msg, exc = repr(msg), msg
         self.orig_exc = exc if isinstance(exc, Exception) else None
-        self.orig_traceback = traceback.format_exc()
+        # Many mist errors are raised just to be caught, so only note where
+        # the exception being handled came from, and read the source lines
+        # and format the traceback when it's actually needed. No frames or
+        # traceback objects are kept, so the error stays picklable.
+        exc_type, exc_value, exc_tb = sys.exc_info()
+        self._orig_frames = []
+        self._orig_exc_only = []
+        if exc_type is None:
+            # same as what traceback.format_exc() gives in that case
+            self._orig_traceback = 'None\n'
+        else:
+            self._orig_traceback = None
+            while exc_tb is not None:
+                code = exc_tb.tb_frame.f_code
+                self._orig_frames.append((code.co_filename, exc_tb.tb_lineno,
+                                          code.co_name))
+                exc_tb = exc_tb.tb_next
+            self._orig_exc_only = traceback.format_exception_only(exc_type,
+                                                                  exc_value)
         msg = "%s: %s" % (self.msg, msg) if msg is not None else self.msg
         super(MistError, self).__init__(msg)
 
+    @property
+    def orig_traceback(self):
+        """Formatted traceback of the exception handled when raised."""
+        if self._orig_traceback is None:
+            entries = []
+            for filename, lineno, name in self._orig_frames:
+                linecache.checkcache(filename)
+                line = linecache.getline(filename, lineno).strip()
+                entries.append((filename, lineno, name, line or None))
+            self._orig_traceback = ''.join(
+                ['Traceback (most recent call last):\n'] +
+                traceback.format_list(entries) + self._orig_exc_only
+            )
+        return self._orig_traceback
+
+    @orig_traceback.setter
+    def orig_traceback(self, value):
+        self._orig_traceback = value
+
 
 # BAD REQUESTS (translated as 400 in views)
 class BadRequestError(MistError):
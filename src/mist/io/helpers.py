@@ -5,15 +5,19 @@ import re
 import sys
 import time
 import json
+import atexit
 import random
 import socket
 import tempfile
 import logging
+import threading
 import functools
 from hashlib import sha1
+from collections import OrderedDict
 from contextlib import contextmanager
 
 import netaddr
+from libcloud.compute.types import Provider
 from amqp import Message
 from amqp.connection import Connection
 from amqp.exceptions import NotFound as AmqpNotFound
@@ -58,6 +62,49 @@ def get_temp_file(content):
             pass
 
 
+# providers whose drivers connect_provider creates anew on every call, see
+# mist.io.methods._CONN_CACHE
+UNCACHED_PROVIDERS = frozenset((Provider.LIBVIRT, 'bare_metal', 'coreos',
+                                Provider.DOCKER, Provider.VCLOUD,
+                                Provider.INDONESIAN_VCLOUD))
+
+# (id(conn), method, args) -> (conn, timestamp, result), see cached_list
+_LIST_CACHE = OrderedDict()
+_LIST_CACHE_LOCK = threading.Lock()
+_LIST_CACHE_SIZE = 64
+
+
+def cached_list(conn, method, *args, **kwargs):
+    """Call conn.method(*args, **kwargs) and cache the result for a while.
+
+    It is meant for listings that rarely change, like conn.list_locations()
+    or conn.list_images(), which are otherwise fetched from the provider over
+    and over. Results are kept for 'ttl' seconds (default 60) and at most
+    _LIST_CACHE_SIZE results are kept, oldest first out. A new list is
+    returned every time, so callers are free to extend it.
+
+    Drivers of UNCACHED_PROVIDERS are new on every call, so their results
+    could never be reused and are not cached.
+
+    """
+    ttl = kwargs.pop('ttl', 60)
+    if getattr(conn, 'type', None) in UNCACHED_PROVIDERS:
+        return list(getattr(conn, method)(*args, **kwargs))
+    key = (id(conn), method, repr(args), repr(sorted(kwargs.items())))
+    with _LIST_CACHE_LOCK:
+        entry = _LIST_CACHE.get(key)
+    # the entry keeps a reference to conn, so its id can't have been reused
+    if entry is not None and entry[0] is conn and time.time() - entry[1] < ttl:
+        return list(entry[2])
+    result = getattr(conn, method)(*args, **kwargs)
+    with _LIST_CACHE_LOCK:
+        _LIST_CACHE.pop(key, None)
+        _LIST_CACHE[key] = (conn, time.time(), result)
+        while len(_LIST_CACHE) > _LIST_CACHE_SIZE:
+            _LIST_CACHE.popitem(last=False)
+    return list(result)
+
+
 def params_from_request(request):
     """Get the parameters dict from request.
 
@@ -65,9 +112,12 @@ def params_from_request(request):
     the dict.
 
     """
+    # most GET requests have no body, don't raise and catch a decode error
+    if not request.body:
+        return request.params
     try:
         params = request.json_body
-    except:
+    except ValueError:
         params = request.params
     return params
 
@@ -236,8 +286,62 @@ def amqp_user_listening(user):
         connection.close()
 
 
+# Session updates are published from a background thread, so that the AMQP
+# round trip doesn't delay the request or SSH session that triggered them.
+# Updates for the same user that pile up meanwhile are merged in one message.
+_SESSION_UPDATES = OrderedDict()  # email -> list of sections
+_SESSION_UPDATES_LOCK = threading.Lock()
+# held while taking and publishing a batch, so that a flush waits for it
+_SESSION_UPDATES_PUBLISH_LOCK = threading.Lock()
+_SESSION_UPDATES_EVENT = threading.Event()
+_session_updates_pid = None
+
+
+def _publish_session_updates():
+    with _SESSION_UPDATES_PUBLISH_LOCK:
+        with _SESSION_UPDATES_LOCK:
+            _SESSION_UPDATES_EVENT.clear()
+            pending = _SESSION_UPDATES.items()
+            _SESSION_UPDATES.clear()
+        for email, sections in pending:
+            amqp_publish_user(email, routing_key='update', data=sections)
+
+
+def _session_updates_worker():
+    while True:
+        _SESSION_UPDATES_EVENT.wait()
+        _publish_session_updates()
+
+
+def flush_session_updates():
+    """Publish pending session updates now.
+
+    The worker thread is a daemon and dies with the process, so this is
+    called when a process exits, eg when uwsgi or celery recycle workers.
+
+    """
+    if _session_updates_pid == os.getpid():
+        _publish_session_updates()
+
+
 def trigger_session_update(email, sections=['clouds', 'keys', 'monitoring']):
-    amqp_publish_user(email, routing_key='update', data=sections)
+    global _session_updates_pid
+    with _SESSION_UPDATES_LOCK:
+        # start the worker lazily in each process, eg uwsgi workers are
+        # forked after this module has been imported
+        if _session_updates_pid != os.getpid():
+            _session_updates_pid = os.getpid()
+            _SESSION_UPDATES.clear()
+            worker = threading.Thread(target=_session_updates_worker,
+                                      name='SessionUpdates')
+            worker.daemon = True
+            worker.start()
+            atexit.register(flush_session_updates)
+        pending = _SESSION_UPDATES.setdefault(email, [])
+        for section in sections:
+            if section not in pending:
+                pending.append(section)
+    _SESSION_UPDATES_EVENT.set()
 
 
 def amqp_log(msg):
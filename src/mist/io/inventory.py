@@ -1,3 +1,5 @@
+import os
+
 import mist.io.methods
 
 
@@ -40,11 +42,22 @@ class MistInventory(object):
                 'ansible_ssh_private_key_file': 'id_rsa/%s' % key_id,
             }
 
-    def export(self, include_localhost=True):
+    def export(self, include_localhost=True, base_dir=''):
+        """Return a dict of file paths to file contents for ansible.
+
+        Paths are relative. If the files are going to be saved in base_dir,
+        pass it along so that the inventory refers to the private keys by
+        their absolute path.
+
+        """
         ans_inv = ''
         if include_localhost:
             ans_inv += 'localhost\tansible_connection=local\n\n'
         for name, host in self.hosts.items():
+            if base_dir:
+                host = dict(host, ansible_ssh_private_key_file=os.path.join(
+                    base_dir, host['ansible_ssh_private_key_file']
+                ))
             vars_part = ' '.join(["%s=%s" % item for item in host.items()])
             ans_inv += '%s\t%s\n' % (name, vars_part)
         ans_inv += ('\n[all:vars]\n'
@@ -1,4 +1,5 @@
 import os
+import errno
 import shutil
 import random
 import socket
@@ -8,7 +9,10 @@ import base64
 import requests
 import subprocess
 import re
+import threading
+from collections import OrderedDict
 from time import sleep, time
+from stat import S_ISDIR
 from datetime import datetime
 from hashlib import sha256
 from StringIO import StringIO
@@ -28,12 +32,6 @@ from libcloud.dns.types import Provider as DnsProvider
 from libcloud.dns.types import RecordType
 from libcloud.dns.providers import get_driver as get_dns_driver
 
-import ansible.playbook
-import ansible.utils.template
-import ansible.callbacks
-import ansible.utils
-import ansible.constants
-
 try:
     from mist.core import config, model
 except ImportError:
@@ -41,6 +39,7 @@ except ImportError:
 
 from mist.io.shell import Shell
 from mist.io.helpers import get_temp_file
+from mist.io.helpers import cached_list, UNCACHED_PROVIDERS
 from mist.io.helpers import get_auth_header
 from mist.io.helpers import parse_ping
 from mist.io.bare_metal import BareMetalDriver, CoreOSDriver
@@ -1201,6 +1200,27 @@ def disassociate_key(user, key_id, cloud_id, machine_id, host=None):
     trigger_session_update(user.email, ['keys'])
 
 
+# Driver instances are cached per set of cloud credentials, so that
+# consecutive requests towards the same cloud reuse the driver's HTTP
+# connection (keep-alive, TLS session) and any auth tokens it holds.
+# libcloud connections aren't thread safe, so every thread keeps its own
+# cache. Libvirt connections are closed after use and bare metal/coreos
+# drivers depend on the saved machines, so those are always created anew.
+# Docker and vCloud drivers are set up by tweaking the global libcloud SSL
+# settings, which would be left to whatever cloud connected last on a hit.
+_CONN_CACHE = threading.local()
+_CONN_CACHE_SIZE = 32
+_CONN_CACHE_SKIP = UNCACHED_PROVIDERS
+
+
+def _conn_cache_key(cloud):
+    fields = [cloud.provider, cloud.apikey, cloud.apisecret, cloud.apiurl,
+              cloud.tenant_name, cloud.auth_version, cloud.region,
+              cloud.compute_endpoint, cloud.key_file, cloud.cert_file,
+              cloud.ca_cert_file, cloud.docker_port]
+    return sha256(json.dumps(fields)).hexdigest()
+
+
 def connect_provider(cloud):
     """Establishes cloud connection using the credentials specified.
 
@@ -1213,7 +1233,29 @@ def connect_provider(cloud):
 
     Cloud is expected to be a mist.io.model.Cloud
 
+    Connections are cached and reused by calls from the same thread with
+    the same cloud credentials, see _CONN_CACHE.
+
     """
+    if cloud.provider in _CONN_CACHE_SKIP:
+        return _connect_provider(cloud)
+    try:
+        cache = _CONN_CACHE.conns
+    except AttributeError:
+        cache = _CONN_CACHE.conns = OrderedDict()
+    key = _conn_cache_key(cloud)
+    conn = cache.pop(key, None)
+    if conn is None:
+        conn = _connect_provider(cloud)
+    # (re)insert to mark as most recently used
+    cache[key] = conn
+    while len(cache) > _CONN_CACHE_SIZE:
+        cache.popitem(last=False)
+    return conn
+
+
+def _connect_provider(cloud):
+    """Create a new libcloud driver instance for cloud."""
     import libcloud.security
     if cloud.provider == Provider.LIBVIRT:
         import libcloud.compute.drivers.libvirt_driver
@@ -1302,6 +1344,25 @@ def connect_provider(cloud):
     return conn
 
 
+# (cloud type, state, bare metal can_reboot, libvirt hypervisor) -> actions
+_MACHINE_ACTIONS = {}
+
+# providers whose machines can't be tagged in standalone mist.io
+_NO_TAG_PROVIDERS = frozenset((
+    Provider.RACKSPACE_FIRST_GEN, Provider.LINODE, Provider.NEPHOSCALE,
+    Provider.SOFTLAYER, Provider.DIGITAL_OCEAN, Provider.DOCKER,
+    Provider.AZURE, Provider.VCLOUD, Provider.INDONESIAN_VCLOUD,
+    Provider.LIBVIRT, Provider.HOSTVIRTUAL, Provider.VSPHERE, Provider.VULTR,
+    Provider.PACKET, 'bare_metal', 'coreos'
+))
+
+# providers whose machines can be renamed
+_RENAME_PROVIDERS = frozenset((
+    Provider.LINODE, Provider.NEPHOSCALE, Provider.DIGITAL_OCEAN,
+    Provider.OPENSTACK, Provider.RACKSPACE
+)).union(config.EC2_PROVIDERS)
+
+
 def get_machine_actions(machine_from_api, conn, extra):
     """Returns available machine actions based on cloud type.
 
@@ -1311,7 +1372,24 @@ def get_machine_actions(machine_from_api, conn, extra):
     The available actions are based on the machine state. The state
     codes supported by mist.io are those of libcloud, check config.py.
 
+    The actions only depend on the cloud type, the machine state and a couple
+    of flags in extra, so they are computed once per combination and kept in
+    _MACHINE_ACTIONS.
+
     """
+    can_reboot = conn.type in ['bare_metal', 'coreos'] and \
+        bool(extra.get('can_reboot', False))
+    hypervisor = conn.type == Provider.LIBVIRT and \
+        extra.get('tags', {}).get('type', None) == 'hypervisor'
+    key = (conn.type, machine_from_api.state, can_reboot, hypervisor)
+    actions = _MACHINE_ACTIONS.get(key)
+    if actions is None:
+        actions = _MACHINE_ACTIONS[key] = _get_machine_actions(*key)
+    return dict(actions)
+
+
+def _get_machine_actions(provider, state, extra_can_reboot, hypervisor):
+    """Compute the actions returned by get_machine_actions."""
 
     # defaults for running state
     can_start = False
@@ -1329,59 +1407,56 @@ def get_machine_actions(machine_from_api, conn, extra):
     try:
         from mist.core.views import set_machine_tags
     except ImportError:
-        if conn.type in (Provider.RACKSPACE_FIRST_GEN, Provider.LINODE,
-                         Provider.NEPHOSCALE, Provider.SOFTLAYER,
-                         Provider.DIGITAL_OCEAN, Provider.DOCKER, Provider.AZURE,
-                         Provider.VCLOUD, Provider.INDONESIAN_VCLOUD, Provider.LIBVIRT, Provider.HOSTVIRTUAL, Provider.VSPHERE, Provider.VULTR, Provider.PACKET, 'bare_metal', 'coreos'):
+        if provider in _NO_TAG_PROVIDERS:
             can_tag = False
 
     # for other states
-    if machine_from_api.state in (NodeState.REBOOTING, NodeState.PENDING):
+    if state in (NodeState.REBOOTING, NodeState.PENDING):
         can_start = False
         can_stop = False
         can_reboot = False
-    elif machine_from_api.state in (NodeState.UNKNOWN, NodeState.STOPPED):
+    elif state in (NodeState.UNKNOWN, NodeState.STOPPED):
         # We assume unknown state mean stopped
         can_stop = False
         can_start = True
         can_reboot = False
-    elif machine_from_api.state in (NodeState.TERMINATED,):
+    elif state in (NodeState.TERMINATED,):
         can_start = False
         can_destroy = False
         can_stop = False
         can_reboot = False
 
-    if conn.type in ['bare_metal', 'coreos']:
+    if provider in ['bare_metal', 'coreos']:
         can_start = False
         can_destroy = False
         can_stop = False
         can_reboot = False
 
-        if extra.get('can_reboot', False):
+        if extra_can_reboot:
         # allow reboot action for bare metal with key associated
             can_reboot = True
 
 
-    if conn.type in [Provider.LINODE]:
-        if machine_from_api.state is NodeState.PENDING:
+    if provider in [Provider.LINODE]:
+        if state is NodeState.PENDING:
         #after resize, node gets to pending mode, needs to be started
             can_start = True
 
-    if conn.type in [Provider.LIBVIRT]:
+    if provider in [Provider.LIBVIRT]:
         can_undefine = True
-        if machine_from_api.state is NodeState.TERMINATED:
+        if state is NodeState.TERMINATED:
         # in libvirt a terminated machine can be started
             can_start = True
-        if machine_from_api.state is NodeState.RUNNING:
+        if state is NodeState.RUNNING:
             can_suspend = True
-        if machine_from_api.state is NodeState.SUSPENDED:
+        if state is NodeState.SUSPENDED:
             can_resume = True
 
-    if conn.type in [Provider.VCLOUD, Provider.INDONESIAN_VCLOUD] and machine_from_api.state is NodeState.PENDING:
+    if provider in [Provider.VCLOUD, Provider.INDONESIAN_VCLOUD] and state is NodeState.PENDING:
         can_start = True
         can_stop = True
 
-    if conn.type == Provider.LIBVIRT and extra.get('tags', {}).get('type', None) == 'hypervisor':
+    if hypervisor:
         # allow only reboot action for libvirt hypervisor
         can_stop = False
         can_destroy = False
@@ -1390,11 +1465,7 @@ def get_machine_actions(machine_from_api, conn, extra):
         can_suspend = False
         can_resume = False
 
-    if conn.type in (Provider.LINODE, Provider.NEPHOSCALE, Provider.DIGITAL_OCEAN,
-                     Provider.OPENSTACK, Provider.RACKSPACE) or conn.type in config.EC2_PROVIDERS:
-        can_rename = True
-    else:
-        can_rename = False
+    can_rename = provider in _RENAME_PROVIDERS
 
 
     return {'can_stop': can_stop,
@@ -1638,7 +1709,7 @@ def create_machine(user, cloud_id, key_id, machine_name, location_id,
         node = _create_machine_openstack(conn, private_key, public_key,
                                          machine_name, image, size, location, networks, cloud_init)
     elif conn.type in config.EC2_PROVIDERS and private_key:
-        locations = conn.list_locations()
+        locations = cached_list(conn, 'list_locations')
         for loc in locations:
             if loc.id == location_id:
                 location = loc
@@ -1866,13 +1937,29 @@ def _create_machine_ec2(conn, key_name, private_key, public_key,
 
     """
 
+    # Check which keypairs and security groups already exist, so that we
+    # don't have to make a request that is expected to fail. The listings
+    # are cached for a few minutes, if they are stale the 'Duplicate' error
+    # is still handled below.
+    try:
+        keypairs = [kp.name for kp in cached_list(conn, 'list_key_pairs',
+                                                  ttl=300)]
+        security_groups = cached_list(conn, 'ex_list_security_groups',
+                                      ttl=300)
+    except Exception as exc:
+        log.warning("Couldn't list EC2 keypairs/security groups: %r", exc)
+        keypairs = security_groups = []
+
     # import key. This is supported only for EC2 at the moment.
-    with get_temp_file(public_key) as tmp_key_path:
+    if key_name in keypairs:
+        log.debug('Key already exists, not importing anything.')
+    else:
         try:
             log.info("Attempting to import key (ec2-only)")
-            conn.ex_import_keypair(name=key_name, keyfile=tmp_key_path)
+            conn.ex_import_keypair_from_string(name=key_name,
+                                               key_material=public_key)
         except Exception as exc:
-            if 'Duplicate' in exc.message:
+            if 'Duplicate' in str(exc):
                 log.debug('Key already exists, not importing anything.')
             else:
                 log.error('Failed to import key.')
@@ -1882,15 +1969,19 @@ def _create_machine_ec2(conn, key_name, private_key, public_key,
     # create security group
     name = config.EC2_SECURITYGROUP.get('name', '')
     description = config.EC2_SECURITYGROUP.get('description', '')
-    try:
-        log.info("Attempting to create security group")
-        conn.ex_create_security_group(name=name, description=description)
-        conn.ex_authorize_security_group_permissive(name=name)
-    except Exception as exc:
-        if 'Duplicate' in exc.message:
-            log.info('Security group already exists, not doing anything.')
-        else:
-            raise InternalServerError("Couldn't create security group", exc)
+    if name in security_groups:
+        log.info('Security group already exists, not doing anything.')
+    else:
+        try:
+            log.info("Attempting to create security group")
+            conn.ex_create_security_group(name=name, description=description)
+            conn.ex_authorize_security_group_permissive(name=name)
+        except Exception as exc:
+            if 'Duplicate' in str(exc):
+                log.info('Security group already exists, not doing anything.')
+            else:
+                raise InternalServerError("Couldn't create security group",
+                                          exc)
 
     with get_temp_file(private_key) as tmp_key_path:
         #deploy_node wants path for ssh private key
@@ -2107,7 +2198,7 @@ def _create_machine_digital_ocean(conn, key_name, private_key, public_key,
     # check if location allows the private_networking setting
     private_networking = False
     try:
-        locations = conn.list_locations()
+        locations = cached_list(conn, 'list_locations')
         for loc in locations:
             if loc.id == location.id:
                 if 'private_networking' in loc.extra:
@@ -2700,6 +2791,9 @@ def ssh_command(user, cloud_id, machine_id, host, command,
     Autoconfigures shell and returns command's output as string.
     Raises MachineUnauthorizedError if it doesn't manage to connect.
 
+    The SSH connection is kept in mist.io.ssh_pool, so consecutive commands
+    towards the same machine don't have to authenticate again.
+
     """
 
     if cloud_id not in user.clouds:
@@ -2707,14 +2801,61 @@ def ssh_command(user, cloud_id, machine_id, host, command,
     else:
         cloud = user.clouds[cloud_id]
 
-    shell = Shell(host)
-    key_id, ssh_user = shell.autoconfigure(user, cloud_id, machine_id,
-                                           key_id, username, password, port)
-    retval, output = shell.command(command)
-    shell.disconnect()
+    shell = Shell(host, pooled=True)
+    try:
+        key_id, ssh_user = shell.autoconfigure(user, cloud_id, machine_id,
+                                               key_id, username, password,
+                                               port)
+        retval, output = shell.command(command)
+    finally:
+        shell.disconnect()
     return output
 
 
+def ssh_command_many(user, targets, command, concurrency=32):
+    """Run command on many machines in parallel.
+
+    targets is a list of (cloud_id, machine_id, host) tuples. At most
+    concurrency commands run at the same time, each one through ssh_command,
+    so pooled connections are reused.
+
+    Returns a list of dicts, one per target in the same order, containing
+    either the command's output or the error that occurred.
+
+    """
+    from multiprocessing.dummy import Pool as ThreadPool
+    try:
+        from mist.core.helpers import user_from_email
+    except ImportError:
+        from mist.io.helpers import user_from_email
+
+    def run(target):
+        cloud_id, machine_id, host = target
+        ret = {'cloud_id': cloud_id, 'machine_id': machine_id, 'host': host,
+               'output': '', 'error': False}
+        try:
+            # ssh_command may lock_n_load and save the user, and the user's
+            # lock is reentrant per instance, so every thread needs its own
+            thread_user = user_from_email(user.email)
+            ret['output'] = ssh_command(thread_user, cloud_id, machine_id,
+                                        host, command)
+        except MistError as exc:
+            ret['error'] = str(exc)
+        except Exception as exc:
+            log.error("Error running command on %s: %r", host, exc)
+            ret['error'] = repr(exc)
+        return ret
+
+    if not targets:
+        return []
+    pool = ThreadPool(min(concurrency, len(targets)))
+    try:
+        return pool.map(run, targets)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def list_images(user, cloud_id, term=None):
     """List images from each cloud.
 
@@ -2738,13 +2879,13 @@ def list_images(user, cloud_id, term=None):
         images = []
         if conn.type in config.EC2_PROVIDERS:
             imgs = config.EC2_IMAGES[conn.type].keys() + starred
-            ec2_images = conn.list_images(None, imgs)
+            ec2_images = cached_list(conn, 'list_images', None, imgs)
             for image in ec2_images:
                 image.name = config.EC2_IMAGES[conn.type].get(image.id, image.name)
-            ec2_images += conn.list_images(ex_owner="amazon")
-            ec2_images += conn.list_images(ex_owner="self")
+            ec2_images += cached_list(conn, 'list_images', ex_owner="amazon")
+            ec2_images += cached_list(conn, 'list_images', ex_owner="self")
         elif conn.type == Provider.GCE:
-            rest_images = conn.list_images()
+            rest_images = cached_list(conn, 'list_images')
             for gce_image in rest_images:
                 if gce_image.extra.get('licenses'):
                     gce_image.extra['licenses'] = None
@@ -2752,7 +2893,7 @@ def list_images(user, cloud_id, term=None):
         elif conn.type == Provider.AZURE:
             # do not show Microsoft Windows images
             # from Azure's response we can't know which images are default
-            rest_images = conn.list_images()
+            rest_images = cached_list(conn, 'list_images')
             rest_images = [image for image in rest_images if 'windows' not in image.name.lower()
                            and 'RightImage' not in image.name and 'Barracuda' not in image.name and 'BizTalk' not in image.name]
             temp_dict = {}
@@ -2764,15 +2905,16 @@ def list_images(user, cloud_id, term=None):
             #get mist.io default docker images from config
             rest_images = [NodeImage(id=image, name=name, driver=conn, extra={})
                               for image, name in config.DOCKER_IMAGES.items()]
-            rest_images += conn.list_images()
+            rest_images += cached_list(conn, 'list_images')
         elif conn.type == Provider.LIBVIRT:
             rest_images = conn.list_images(location=cloud.images_location)
         else:
-            rest_images = conn.list_images()
+            rest_images = cached_list(conn, 'list_images')
             starred_images = [image for image in rest_images
                               if image.id in starred]
         if term and conn.type in config.EC2_PROVIDERS:
-            ec2_images += conn.list_images(ex_owner="aws-marketplace")
+            ec2_images += cached_list(conn, 'list_images',
+                                      ex_owner="aws-marketplace")
 
         images = starred_images + ec2_images + rest_images
         images = [img for img in images
@@ -2932,7 +3074,7 @@ def list_locations(user, cloud_id):
     conn = connect_provider(cloud)
 
     try:
-        locations = conn.list_locations()
+        locations = cached_list(conn, 'list_locations')
     except:
         locations = [NodeLocation('', name='default', country='', driver=conn)]
 
@@ -4090,8 +4232,37 @@ def get_stats(user, cloud_id, machine_id, start='', stop='', step='', metrics=''
         raise ServiceUnavailableError(resp.text)
 
 
+_PLAYBOOK_LOCK = threading.Lock()
+
+
+def _ensure_private_dir(path):
+    """Create path with mode 0700, or check that an existing path is a
+    directory owned by us that nobody else can access.
+
+    Raises OSError otherwise.
+
+    """
+    try:
+        os.makedirs(path, 0700)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+    st = os.lstat(path)
+    if not S_ISDIR(st.st_mode):
+        raise OSError(errno.ENOTDIR, "Not a directory", path)
+    if st.st_uid != os.getuid() or st.st_mode & 0077:
+        raise OSError(errno.EPERM,
+                      "Directory must be owned by us with mode 0700", path)
+
+
 def run_playbook(user, cloud_id, machine_id, playbook_path, extra_vars=None,
                  force_handlers=False, debug=False):
+    # ansible is heavy to import and only needed here, so import it lazily
+    import ansible.playbook
+    import ansible.callbacks
+    import ansible.utils
+    import ansible.constants
+
     if not extra_vars:
         extra_vars = None
     ret_dict = {
@@ -4114,57 +4285,86 @@ def run_playbook(user, cloud_id, machine_id, playbook_path, extra_vars=None,
     machine_name = inventory.hosts.keys()[0]
     log_prefix = "Running playbook '%s' on machine '%s'" % (playbook_path,
                                                             machine_name)
-    files = inventory.export(include_localhost=False)
-    ret_dict['inventory'] = files['inventory']
+    # Work with absolute paths inside tmp_dir instead of chdir'ing into it,
+    # since the working directory is shared by all threads of the process.
     tmp_dir = tempfile.mkdtemp()
-    old_dir = os.getcwd()
-    os.chdir(tmp_dir)
+    files = inventory.export(include_localhost=False, base_dir=tmp_dir)
+    ret_dict['inventory'] = files['inventory']
     try:
         log.debug("%s: Saving inventory files", log_prefix)
-        os.mkdir('id_rsa')
+        os.mkdir(os.path.join(tmp_dir, 'id_rsa'))
         for name, data in files.items():
-            with open(name, 'w') as f:
+            with open(os.path.join(tmp_dir, name), 'w') as f:
                 f.write(data)
-        for name in os.listdir('id_rsa'):
-            os.chmod('id_rsa/%s' % name, 0600)
+        for name in os.listdir(os.path.join(tmp_dir, 'id_rsa')):
+            os.chmod(os.path.join(tmp_dir, 'id_rsa', name), 0600)
         log.debug("%s: Inventory files ready", log_prefix)
 
-        playbook_path = '%s/%s' % (old_dir, playbook_path)
-        ansible_hosts_path = 'inventory'
+        playbook_path = os.path.abspath(playbook_path)
+        ansible_hosts_path = os.path.join(tmp_dir, 'inventory')
         # extra_vars['host_key_checking'] = False
 
-        ansible.utils.VERBOSITY = 4 if debug else 0
-        ansible.constants.HOST_KEY_CHECKING = False
-        ansible.constants.ANSIBLE_NOCOWS = True
-        stats = ansible.callbacks.AggregateStats()
-        playbook_cb = ansible.callbacks.PlaybookCallbacks(
-            verbose=ansible.utils.VERBOSITY
-        )
-        runner_cb = ansible.callbacks.PlaybookRunnerCallbacks(
-            stats, verbose=ansible.utils.VERBOSITY
-        )
-        log.error(old_dir)
-        log.error(tmp_dir)
-        log.error(extra_vars)
-        log.error(playbook_path)
-        capture = StdStreamCapture()
+        # Master sockets are kept in a private dir per private key, so that
+        # a master authenticated with one user's key is never reused by
+        # someone else for the same host.
+        keys_digest = sha256()
+        for name in sorted(files):
+            if name.startswith('id_rsa/'):
+                keys_digest.update(files[name])
+        control_dir = os.path.join(config.SSH_CONTROL_DIR,
+                                   keys_digest.hexdigest()[:16])
         try:
-            playbook = ansible.playbook.PlayBook(
-                playbook=playbook_path,
-                host_list=ansible_hosts_path,
-                callbacks=playbook_cb,
-                runner_callbacks=runner_cb,
-                stats=stats,
-                extra_vars=extra_vars,
-                force_handlers=force_handlers,
-            )
-            result = playbook.run()
-        except Exception as exc:
+            _ensure_private_dir(config.SSH_CONTROL_DIR)
+            _ensure_private_dir(control_dir)
+        except OSError as exc:
             log.error("%s: Error %r", log_prefix, exc)
             ret_dict['error_msg'] = repr(exc)
-        finally:
             ret_dict['finished_at'] = time()
-            ret_dict['stdout'] = capture.close()
+            return ret_dict
+        log.error(tmp_dir)
+        log.error(extra_vars)
+        log.error(playbook_path)
+        # ansible's settings, including the control path, and the captured
+        # sys.stdout are process wide, so only one playbook runs at a time
+        with _PLAYBOOK_LOCK:
+            ansible.utils.VERBOSITY = 4 if debug else 0
+            ansible.constants.HOST_KEY_CHECKING = False
+            ansible.constants.ANSIBLE_NOCOWS = True
+            # ansible.cfg is only read when ansible is imported, so set the
+            # ssh multiplexing options here
+            ansible.constants.ANSIBLE_SSH_ARGS = (
+                '-o ControlMaster=auto -o ControlPersist=%ds'
+                % config.SSH_CONTROL_PERSIST
+            )
+            # ansible formats this with a dict(directory=...), hence the %%
+            ansible.constants.ANSIBLE_SSH_CONTROL_PATH = (
+                control_dir + '/mist-ssh-%%h-%%p-%%r'
+            )
+            stats = ansible.callbacks.AggregateStats()
+            playbook_cb = ansible.callbacks.PlaybookCallbacks(
+                verbose=ansible.utils.VERBOSITY
+            )
+            runner_cb = ansible.callbacks.PlaybookRunnerCallbacks(
+                stats, verbose=ansible.utils.VERBOSITY
+            )
+            capture = StdStreamCapture()
+            try:
+                playbook = ansible.playbook.PlayBook(
+                    playbook=playbook_path,
+                    host_list=ansible_hosts_path,
+                    callbacks=playbook_cb,
+                    runner_callbacks=runner_cb,
+                    stats=stats,
+                    extra_vars=extra_vars,
+                    force_handlers=force_handlers,
+                )
+                result = playbook.run()
+            except Exception as exc:
+                log.error("%s: Error %r", log_prefix, exc)
+                ret_dict['error_msg'] = repr(exc)
+            finally:
+                ret_dict['finished_at'] = time()
+                ret_dict['stdout'] = capture.close()
         if ret_dict['error_msg']:
             return ret_dict
         log.debug("%s: Ansible result = %s", log_prefix, result)
@@ -4177,7 +4377,6 @@ def run_playbook(user, cloud_id, machine_id, playbook_path, extra_vars=None,
         ret_dict['success'] = True
         return ret_dict
     finally:
-        os.chdir(old_dir)
         if not debug:
             shutil.rmtree(tmp_dir)
 
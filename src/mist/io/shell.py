@@ -5,8 +5,10 @@ SSH.
 
 """
 
+import re
+import threading
 from time import time, sleep
-from StringIO import StringIO
+from collections import OrderedDict
 
 import paramiko
 import websocket
@@ -22,6 +24,7 @@ from mist.io.exceptions import RequiredParameterMissingError
 from mist.io.exceptions import ServiceUnavailableError
 
 from mist.io.helpers import trigger_session_update
+from mist.io import ssh_pool
 
 try:
     from mist.core import config
@@ -35,6 +38,28 @@ logging.basicConfig(level=config.PY_LOG_LEVEL,
 log = logging.getLogger(__name__)
 
 
+# Matches the message printed by some images (eg EC2) when logging in with
+# the wrong user, for example:
+# Please login as the user "ubuntu" rather than the user "root".
+# Please login as the "ec2-user" user rather than the user "root".
+LOGIN_AS_RE = re.compile(r'Please login as the (?:user )?"?([\w.-]+)"?')
+
+# (cloud_id, machine_id, ssh_user) -> username suggested by the above message,
+# so that next time we login with the right user right away. Only the most
+# recent _SSH_USER_REDIRECTS_SIZE redirects are kept.
+_SSH_USER_REDIRECTS = OrderedDict()
+_SSH_USER_REDIRECTS_LOCK = threading.Lock()
+_SSH_USER_REDIRECTS_SIZE = 1024
+
+
+def _add_ssh_user_redirect(key, ssh_user):
+    with _SSH_USER_REDIRECTS_LOCK:
+        _SSH_USER_REDIRECTS.pop(key, None)
+        _SSH_USER_REDIRECTS[key] = ssh_user
+        while len(_SSH_USER_REDIRECTS) > _SSH_USER_REDIRECTS_SIZE:
+            _SSH_USER_REDIRECTS.popitem(last=False)
+
+
 class ParamikoShell(object):
     """sHell
 
@@ -54,9 +79,15 @@ class ParamikoShell(object):
     for line in shell.command_stream('ps -fe'):
     print line
 
+    If pooled is True, the SSH connection is taken from and returned to
+    mist.io.ssh_pool, so that consecutive shells towards the same machine
+    reuse the same authenticated session. Pooled shells are meant for running
+    commands, not for interactive sessions.
+
     """
 
-    def __init__(self, host, username=None, key=None, password=None, port=22):
+    def __init__(self, host, username=None, key=None, password=None, port=22,
+                 pooled=False):
         """Initialize a Shell instance
 
         Initializes a Shell instance for host. If username is provided, then
@@ -69,14 +100,20 @@ class ParamikoShell(object):
             raise RequiredParameterMissingError('host not given')
         self.host = host
         self.sudo = False
+        self.pooled = pooled
+        self._pool_key = None
 
-        self.ssh = paramiko.SSHClient()
-        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.ssh = self._new_client()
 
         # if username provided, try to connect
         if username:
             self.connect(username, key, password, port)
 
+    def _new_client(self):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return ssh
+
     def connect(self, username, key=None, password=None, port=22):
         """Initialize an SSH connection.
 
@@ -93,8 +130,18 @@ class ParamikoShell(object):
         if not key and not password:
             raise RequiredParameterMissingError("neither key nor password "
                                                 "provided.")
+        if self.pooled:
+            pool_key = ssh_pool.pool_key(self.host, port, username,
+                                         key, password)
+            ssh = ssh_pool.acquire(pool_key)
+            if ssh is not None:
+                log.info("Reusing pooled ssh connection to %s@%s:%s",
+                         username, self.host, port)
+                self.ssh = ssh
+                self._pool_key = pool_key
+                return
         if key:
-            rsa_key = paramiko.RSAKey.from_private_key(StringIO(key))
+            rsa_key = ssh_pool.get_pkey(key)
         else:
             rsa_key = None
 
@@ -127,10 +174,20 @@ class ParamikoShell(object):
                 # eg related to network, but keep until all attempts are made
                 if not attempts:
                     raise ServiceUnavailableError(repr(exc))
-
+        if self.pooled and ssh_pool.add(pool_key, self.ssh):
+            self._pool_key = pool_key
 
     def disconnect(self):
-        """Close the SSH connection."""
+        """Close the SSH connection.
+
+        Pooled connections are handed back to the pool instead of closed.
+
+        """
+        if self._pool_key is not None:
+            ssh_pool.release(self._pool_key)
+            self._pool_key = None
+            self.ssh = self._new_client()
+            return
         try:
             log.info("Closing ssh connection to %s", self.host)
             self.ssh.close()
@@ -151,7 +208,14 @@ class ParamikoShell(object):
 
     def _command(self, cmd, pty=True):
         """Helper method used by command and stream_command."""
-        channel = self.ssh.get_transport().open_session()
+        try:
+            channel = self.ssh.get_transport().open_session()
+        except:
+            # don't hand out a broken pooled connection again
+            if self._pool_key is not None:
+                ssh_pool.discard(self._pool_key)
+                self._pool_key = None
+            raise
         channel.settimeout(10800)
         stdout = channel.makefile()
         stderr = channel.makefile_stderr()
@@ -176,21 +240,15 @@ class ParamikoShell(object):
         """
         log.info("running command: '%s'", cmd)
         stdout, stderr, channel = self._command(cmd, pty)
-        line = stdout.readline()
-        out = ''
-        while line:
-            out += line
-            line = stdout.readline()
+        # read the whole stream at once instead of concatenating it line by
+        # line, which is quadratic in the size of the output
+        out = stdout.read()
 
         if pty:
             retval = channel.recv_exit_status()
             return retval, out
         else:
-            line = stderr.readline()
-            err = ''
-            while line:
-                err += line
-                line = stderr.readline()
+            err = stderr.read()
             retval = channel.recv_exit_status()
 
             return retval, out, err
@@ -285,6 +343,19 @@ class ParamikoShell(object):
                 for name in ['root', 'ubuntu', 'ec2-user', 'user', 'azureuser', 'core', 'centos', 'cloud-user', 'fedora']:
                     if name not in users:
                         users.append(name)
+                # try users we were previously redirected to first, but
+                # keep the original ones in case the redirect is stale
+                redirected_from = {}
+                with _SSH_USER_REDIRECTS_LOCK:
+                    for name in list(users):
+                        redirect = _SSH_USER_REDIRECTS.get(
+                            (cloud_id, machine_id, name)
+                        )
+                        if redirect and redirect not in redirected_from:
+                            redirected_from[redirect] = name
+                            if redirect in users:
+                                users.remove(redirect)
+                            users.insert(users.index(name), redirect)
             for ssh_user in users:
                 try:
                     log.info("ssh -i %s %s@%s:%s",
@@ -294,6 +365,12 @@ class ParamikoShell(object):
                                  password=password,
                                  port=port)
                 except MachineUnauthorizedError:
+                    if ssh_user in redirected_from:
+                        with _SSH_USER_REDIRECTS_LOCK:
+                            _SSH_USER_REDIRECTS.pop(
+                                (cloud_id, machine_id,
+                                 redirected_from.pop(ssh_user)), None
+                            )
                     continue
                 # this is a hack: if you try to login to ec2 with the wrong
                 # username, it won't fail the connection, so a
@@ -302,13 +379,11 @@ class ParamikoShell(object):
                 # This hack tries to identify when such a thing is happening
                 # and then tries to connect with the username suggested in
                 # the prompt.
-                retval, resp = self.command('uptime')
-                new_ssh_user = None
-                if 'Please login as the user ' in resp:
-                    new_ssh_user = resp.split()[5].strip('"')
-                elif 'Please login as the' in resp:
-                    # for EC2 Amazon Linux machines, usually with ec2-user
-                    new_ssh_user = resp.split()[4].strip('"')
+                # The message is echoed to stdout by a command= option in
+                # authorized_keys, so there's no need for a pty or stderr.
+                retval, resp, err = self.command('uptime', pty=False)
+                match = LOGIN_AS_RE.search(resp)
+                new_ssh_user = match.group(1) if match else None
                 if new_ssh_user:
                     log.info("retrying as %s", new_ssh_user)
                     try:
@@ -317,9 +392,13 @@ class ParamikoShell(object):
                                      key=keypair.private,
                                      password=password,
                                      port=port)
-                        ssh_user = new_ssh_user
                     except MachineUnauthorizedError:
                         continue
+                    if not username:
+                        _add_ssh_user_redirect(
+                            (cloud_id, machine_id, ssh_user), new_ssh_user
+                        )
+                    ssh_user = new_ssh_user
                 # we managed to connect succesfully, return
                 # but first update key
                 assoc = [cloud_id,
@@ -486,13 +565,14 @@ class Shell(object):
     Proxy Shell Class to distinguish weather we are talking about Docker or Paramiko Shell
     """
     def __init__(self, host, provider=None, username=None, key=None,
-                 password=None, port=22, enforce_paramiko=False):
+                 password=None, port=22, enforce_paramiko=False, pooled=False):
         """
 
         :param provider: If docker, then DockerShell
         :param host: Host of machine/docker
         :param enforce_paramiko: If True, then Paramiko even for Docker containers. This is useful
         if we want SSH Connection to Docker containers
+        :param pooled: If True, reuse SSH connections from mist.io.ssh_pool
         :return:
         """
 
@@ -505,7 +585,8 @@ class Shell(object):
             self._shell = DockerShell(host)
         else:
             self._shell = ParamikoShell(host, username=username, key=key,
-                                        password=password, port=port)
+                                        password=password, port=port,
+                                        pooled=pooled)
             self.ssh = self._shell.ssh
 
     def autoconfigure(self, user, cloud_id, machine_id, key_id=None,
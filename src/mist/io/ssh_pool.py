@@ -0,0 +1,173 @@
+"""mist.io.ssh_pool
+
+This module keeps authenticated SSH connections around, so that consecutive
+commands towards the same machine reuse an existing session instead of paying
+for a TCP handshake, key exchange and authentication every time.
+
+Connections are keyed by (host, port, username, credentials fingerprint) and
+are shared. Paramiko transports can multiplex many channels, so more than one
+shell may use the same connection at the same time. A background thread
+closes connections once nobody has used them for config.SSH_POOL_IDLE_TIMEOUT
+seconds.
+
+Parsed private keys are cached as well, so that the same PEM isn't decoded
+again for every connection attempt.
+
+"""
+
+import os
+import threading
+from time import time, sleep
+from hashlib import sha1, sha256
+from StringIO import StringIO
+from collections import OrderedDict
+
+import paramiko
+
+try:
+    from mist.core import config
+except ImportError:
+    from mist.io import config
+
+import logging
+logging.basicConfig(level=config.PY_LOG_LEVEL,
+                    format=config.PY_LOG_FORMAT,
+                    datefmt=config.PY_LOG_FORMAT_DATE)
+log = logging.getLogger(__name__)
+
+
+# key -> [paramiko.SSHClient, refcount, last_used]
+_POOL = {}
+_LOCK = threading.Lock()
+_reaper_pid = None
+
+# sha256 of private key -> paramiko.RSAKey
+_PKEYS = OrderedDict()
+_PKEYS_SIZE = 128
+
+
+def get_pkey(private_key):
+    """Return a paramiko.RSAKey for an OpenSSH private RSA key string."""
+    fingerprint = sha256(private_key).hexdigest()
+    with _LOCK:
+        pkey = _PKEYS.get(fingerprint)
+    if pkey is None:
+        pkey = paramiko.RSAKey.from_private_key(StringIO(private_key))
+        with _LOCK:
+            _PKEYS[fingerprint] = pkey
+            while len(_PKEYS) > _PKEYS_SIZE:
+                _PKEYS.popitem(last=False)
+    return pkey
+
+
+def pool_key(host, port, username, key=None, password=None):
+    """Return the key under which a connection is stored in the pool.
+
+    Credentials are only stored as a fingerprint.
+
+    """
+    fingerprint = sha1('%s\0%s' % (key or '', password or '')).hexdigest()
+    return (host, port, username, fingerprint)
+
+
+def _is_active(client):
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+def _close(key, client):
+    log.info("Closing pooled ssh connection to %s@%s:%s",
+             key[2], key[0], key[1])
+    try:
+        client.close()
+    except:
+        pass
+
+
+def _reap():
+    """Drop dead connections and close idle ones. Must hold _LOCK."""
+    now = time()
+    for key, (client, refcount, last_used) in _POOL.items():
+        if not _is_active(client) or \
+                (not refcount and now - last_used > config.SSH_POOL_IDLE_TIMEOUT):
+            del _POOL[key]
+            _close(key, client)
+
+
+def _reaper():
+    while True:
+        sleep(min(config.SSH_POOL_IDLE_TIMEOUT, 60))
+        with _LOCK:
+            _reap()
+
+
+def _start_reaper():
+    """Start the reaper thread once per process. Must hold _LOCK.
+
+    Connections inherited from the parent after a fork are dropped, since
+    their sockets are still used by the parent.
+
+    """
+    global _reaper_pid
+    # uwsgi and celery workers are forked after this module is imported
+    if _reaper_pid != os.getpid():
+        _reaper_pid = os.getpid()
+        _POOL.clear()
+        reaper = threading.Thread(target=_reaper, name='SSHPoolReaper')
+        reaper.daemon = True
+        reaper.start()
+
+
+def acquire(key):
+    """Return a connected paramiko.SSHClient for key or None.
+
+    Every client returned by acquire must be handed back using release.
+
+    """
+    with _LOCK:
+        _start_reaper()
+        _reap()
+        entry = _POOL.get(key)
+        if entry is None:
+            return None
+        entry[1] += 1
+        entry[2] = time()
+        return entry[0]
+
+
+def add(key, client):
+    """Store a freshly connected client in the pool and mark it as in use.
+
+    Returns True if the client was stored. If another thread added a
+    connection for the same key in the meantime, or if the pool is full,
+    False is returned and the caller remains responsible for closing client.
+
+    """
+    with _LOCK:
+        _start_reaper()
+        _reap()
+        if key in _POOL or len(_POOL) >= config.SSH_POOL_MAX_SIZE:
+            return False
+        transport = client.get_transport()
+        if transport is not None:
+            transport.set_keepalive(30)
+        _POOL[key] = [client, 1, time()]
+        return True
+
+
+def release(key):
+    """Mark a client acquired through acquire or add as no longer in use."""
+    with _LOCK:
+        entry = _POOL.get(key)
+        if entry is not None:
+            entry[1] = max(entry[1] - 1, 0)
+            entry[2] = time()
+
+
+def discard(key):
+    """Remove and close the connection stored under key, if any."""
+    with _LOCK:
+        entry = _POOL.pop(key, None)
+    if entry is not None:
+        _close(key, entry[0])
+
@@ -16,17 +16,13 @@ from memcache import Client as MemcacheClient
 
 from celery import Celery, Task
 from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_process_shutdown
 
 from amqp import Message
 from amqp.connection import Connection
 
 from paramiko.ssh_exception import SSHException
 
-import ansible.playbook
-import ansible.utils.template
-from ansible import callbacks
-from ansible import utils
-
 from mist.io.exceptions import ServiceUnavailableError, MachineNotFoundError
 from mist.io.exceptions import MistError
 from mist.io.shell import Shell
@@ -49,6 +45,7 @@ except ImportError:  # Standalone mist.io
 from mist.io.helpers import amqp_publish_user
 from mist.io.helpers import amqp_user_listening
 from mist.io.helpers import amqp_log
+from mist.io.helpers import flush_session_updates
 
 
 # libcloud certificate fix for OS X
@@ -65,6 +62,12 @@ app = Celery('tasks')
 app.conf.update(**config.CELERY_SETTINGS)
 
 
+@worker_process_shutdown.connect
+def flush_pending_session_updates(**kwargs):
+    # pool processes are recycled without running atexit handlers
+    flush_session_updates()
+
+
 @app.task
 def update_machine_count(email, cloud_id, machine_count):
     if not multi_user:
@@ -83,11 +86,14 @@ def update_machine_count(email, cloud_id, machine_count):
 def ssh_command(email, cloud_id, machine_id, host, command,
                       key_id=None, username=None, password=None, port=22):
     user = user_from_email(email)
-    shell = Shell(host)
-    key_id, ssh_user = shell.autoconfigure(user, cloud_id, machine_id,
-                                           key_id, username, password, port)
-    retval, output = shell.command(command)
-    shell.disconnect()
+    shell = Shell(host, pooled=True)
+    try:
+        key_id, ssh_user = shell.autoconfigure(user, cloud_id, machine_id,
+                                               key_id, username, password,
+                                               port)
+        retval, output = shell.command(command)
+    finally:
+        shell.disconnect()
     if retval:
         from mist.io.methods import notify_user
         notify_user(user, "Async command failed for machine %s (%s)" %
@@ -794,10 +800,12 @@ class ProbeSSH(UserTask):
     polling = True
     soft_time_limit = 60
 
-    def execute(self, email, cloud_id, machine_id, host):
+    def execute(self, email, cloud_id, machine_id, host, key_id='',
+                ssh_user=''):
         user = user_from_email(email)
         from mist.io.methods import probe_ssh_only
-        res = probe_ssh_only(user, cloud_id, machine_id, host)
+        res = probe_ssh_only(user, cloud_id, machine_id, host,
+                             key_id=key_id, ssh_user=ssh_user)
         return {'cloud_id': cloud_id,
                 'machine_id': machine_id,
                 'host': host,
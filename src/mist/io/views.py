@@ -1310,7 +1310,10 @@ def associate_ip(request):
 def probe(request):
     """
     Probe a machine
-    Ping and SSH to machine and collect various metrics.
+    Ping and SSH to machine and collect various metrics. If async is true, the
+    probe runs in the background and the results are pushed to the user's
+    'probe' and 'ping' channels instead, while any recent results that are
+    already cached are returned right away.
     ---
     cloud:
       in: path
@@ -1330,6 +1333,9 @@ def probe(request):
       in: query
       required: false
       type: string
+    async:
+      description: ' Probe in the background instead of waiting for the result'
+      type: boolean
     """
     machine_id = request.matchdict['machine']
     cloud_id = request.matchdict['cloud']
@@ -1337,12 +1343,31 @@ def probe(request):
     host = params.get('host', None)
     key_id = params.get('key', None)
     ssh_user = params.get('ssh_user', '')
+    async = params.get('async', False)
     # FIXME: simply don't pass a key parameter
     if key_id == 'undefined':
         key_id = ''
     user = user_from_request(request)
-    ret = methods.probe(user, cloud_id, machine_id, host, key_id, ssh_user)
-    return ret
+    if not async:
+        return methods.probe(user, cloud_id, machine_id, host, key_id,
+                             ssh_user)
+    if not host:
+        raise RequiredParameterMissingError('host')
+    if cloud_id not in user.clouds:
+        raise CloudNotFoundError(cloud_id)
+    from mist.io import tasks
+    # use smart_delay with the same arguments as the sockjs connection does,
+    # so that both share the same cached results and polling sequence
+    kwargs = {}
+    if key_id:
+        kwargs['key_id'] = key_id
+    if ssh_user:
+        kwargs['ssh_user'] = ssh_user
+    return {'cloud_id': cloud_id, 'machine_id': machine_id, 'host': host,
+            'probe': tasks.ProbeSSH().smart_delay(user.email, cloud_id,
+                                                  machine_id, host, **kwargs),
+            'ping': tasks.Ping().smart_delay(user.email, cloud_id,
+                                             machine_id, host)}
 
 
 @view_config(route_name='api_v1_monitoring', request_method='GET', renderer='json')